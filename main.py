@@ -1,4 +1,3 @@
-import re
 import json
 import time
 from typing import List, Dict, Any, Optional
@@ -9,13 +8,93 @@ from astrbot.api.provider import ProviderRequest
 from astrbot.core.message.components import Plain, At, BaseMessageComponent
 from astrbot.core.platform.sources.aiocqhttp.aiocqhttp_message_event import AiocqhttpMessageEvent
 
+try:
+    import orjson  # C 实现的 JSON 序列化，大群成员列表下明显快于标准库
+except ImportError:
+    orjson = None
+
+# 标签起始标记；in/find 对短 ASCII 子串走 C 层 memmem 快速路径
+_AT_MARK = "[at:"
+# @后的分隔文本：一个空格避免粘连，加零宽空格
+_AT_SEP = " \u200b"
+# 群成员列表缓存的有效期（秒）与缓存群数量上限
+_MEMBERS_CACHE_TTL = 45.0
+_MEMBERS_CACHE_MAX = 64
+# At 组件缓存的条目上限
+_AT_CACHE_MAX = 256
+# 单次查询最多返回的成员数，超出则按角色优先截断
+_MEMBERS_LIMIT = 500
+_ROLE_ORDER = {"owner": 0, "admin": 1}
+# 角色中文映射
+_ROLE_MAP = {"owner": "群主", "admin": "管理员", "member": "成员"}
+# 注入到 System Prompt 的艾特协议说明（XML 格式），模块层只构建一次
+_AT_INSTRUCTION = (
+    "\n\n"
+    "<at_mention_protocol>\n"
+    "    <description>协议用于在群聊中艾特(At)特定成员以引起注意。</description>\n"
+    "    <workflow>\n"
+    "        <step index='1'>判断是否需要艾特某人（如回复特定提问、提醒）。</step>\n"
+    "        <step index='2'>检查是否已知目标成员的 user_id (QQ号)。</step>\n"
+    "        <step index='3'>若未知，必须调用工具 `get_group_members` 获取成员列表。</step>\n"
+    "        <step index='4'>获取 user_id 后，在回复文本中直接插入标签。</step>\n"
+    "    </workflow>\n"
+    "    <output_format>\n"
+    "        <tag_syntax>[at:user_id]</tag_syntax>\n"
+    "        <requirement>直接输出标签，不要使用 Markdown 链接或 @昵称。</requirement>\n"
+    "    </output_format>\n"
+    "    <examples>\n"
+    "        <correct>好的 [at:123456] 我明白了。</correct>\n"
+    "        <incorrect>@张三 , [at:张三]</incorrect>\n"
+    "    </examples>\n"
+    "</at_mention_protocol>\n"
+)
+
+def _scan_at_tags(text: str, pos: int = 0):
+    """从 pos 起顺序扫描文本中的 [at:...] 标签，产出 (起点, 终点, id)。
+
+    合法标签（[at:数字]）的 id 为数字字符串；疑似但格式错误的标签
+    （冒号后至多 32 个非空白字符，如 [at:某人]）id 为 None，供调用方除杂。
+    纯 str.find + 切片实现，等价于此前的正则，但省去 SRE 虚拟机
+    和每次命中的 Match 对象开销。调用方若已定位首个标记，可经 pos
+    传入，避免对前缀文本的重复搜索。
+    """
+    i = pos
+    n = len(text)
+    while True:
+        j = text.find(_AT_MARK, i)
+        if j < 0:
+            return
+        k = j + 4
+        while k < n and text[k].isdigit():
+            k += 1
+        if k > j + 4 and k < n and text[k] == "]":
+            yield j, k + 1, text[j + 4:k]
+            i = k + 1
+            continue
+        # 非纯数字：尝试按除杂分支匹配（至多 32 个非 ']' 非空白字符 + ']'）
+        end = text.find("]", j + 4, j + 37)
+        if end >= 0 and not any(ch.isspace() for ch in text[j + 4:end]):
+            yield j, end + 1, None
+            i = end + 1
+        else:
+            i = j + 4
+
+def _dumps(data: Any) -> str:
+    """序列化工具返回值；orjson 可用时走 C 路径，缺失时回退标准库。"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2).decode()
+    return json.dumps(data, ensure_ascii=False, indent=2)
+
 class LLMAtToolPlugin(Star):
     def __init__(self, context: Context):
         super().__init__(context)
-        # 匹配合法的 [at:123456]
-        self.valid_at_pattern = re.compile(r'\[at:(\d+)\]')
-        # 匹配疑似标签但格式错误的，用于除杂 (例如 [at:某人], [at:unknown])
-        self.garbage_at_pattern = re.compile(r'\[at:[^\]]+\]')
+        # 分隔组件内容固定且从不被修改，预构建一次供所有消息复用
+        self._at_sep = Plain(_AT_SEP)
+        # 群成员列表短 TTL 缓存：group_id -> (写入时的单调时钟, 原始成员列表)
+        self._members_cache: Dict[str, tuple] = {}
+        # At 组件按 user_id 复用：活跃群里被艾特的通常是少数几个成员。
+        # 组件在链中从不被修改，复用同一实例是安全的
+        self._at_cache: Dict[str, At] = {}
 
     @filter.on_llm_request()
     async def inject_at_instruction(self, event: AstrMessageEvent, req: ProviderRequest):
@@ -23,27 +102,10 @@ class LLMAtToolPlugin(Star):
         在 LLM 请求前注入 System Prompt。
         使用 XML 格式定义艾特协议。
         """
-        instruction = (
-            "\n\n"
-            "<at_mention_protocol>\n"
-            "    <description>协议用于在群聊中艾特(At)特定成员以引起注意。</description>\n"
-            "    <workflow>\n"
-            "        <step index='1'>判断是否需要艾特某人（如回复特定提问、提醒）。</step>\n"
-            "        <step index='2'>检查是否已知目标成员的 user_id (QQ号)。</step>\n"
-            "        <step index='3'>若未知，必须调用工具 `get_group_members` 获取成员列表。</step>\n"
-            "        <step index='4'>获取 user_id 后，在回复文本中直接插入标签。</step>\n"
-            "    </workflow>\n"
-            "    <output_format>\n"
-            "        <tag_syntax>[at:user_id]</tag_syntax>\n"
-            "        <requirement>直接输出标签，不要使用 Markdown 链接或 @昵称。</requirement>\n"
-            "    </output_format>\n"
-            "    <examples>\n"
-            "        <correct>好的 [at:123456] 我明白了。</correct>\n"
-            "        <incorrect>@张三 , [at:张三]</incorrect>\n"
-            "    </examples>\n"
-            "</at_mention_protocol>\n"
-        )
-        req.system_prompt += instruction
+        # 已注入过则跳过，避免同一会话内重复拼接
+        if _AT_INSTRUCTION in req.system_prompt:
+            return
+        req.system_prompt += _AT_INSTRUCTION
 
     # 群成员查询工具 (无限制返回)
     @filter.llm_tool(name="get_group_members")
@@ -54,7 +116,7 @@ class LLMAtToolPlugin(Star):
         Args:
             keyword(string): 可选。搜索关键词（昵称/群名片/QQ号）。如果不填则返回所有成员。
         """
-        start_time = time.time()
+        start_time = time.monotonic()
         
         # 环境检查
         group_id = event.get_group_id()
@@ -65,13 +127,28 @@ class LLMAtToolPlugin(Star):
             return json.dumps({"status": "error", "message": "当前平台不支持获取群成员列表。"}, ensure_ascii=False)
 
         try:
-            # 获取原始数据
-            raw_members = await event.bot.api.call_action('get_group_member_list', group_id=group_id)
+            # 获取原始数据（短 TTL 缓存，同一会话内 LLM 连续调用时省去 OneBot 往返）
+            now = time.monotonic()
+            cached = self._members_cache.get(group_id)
+            if cached and now - cached[0] < _MEMBERS_CACHE_TTL:
+                raw_members = cached[1]
+            else:
+                raw_members = await event.bot.api.call_action('get_group_member_list', group_id=group_id)
+                if raw_members:
+                    if len(self._members_cache) >= _MEMBERS_CACHE_MAX:
+                        # 按插入顺序淘汰最旧的群，防止缓存无限增长
+                        self._members_cache.pop(next(iter(self._members_cache)))
+                    self._members_cache[group_id] = (now, raw_members)
             if not raw_members:
                 return json.dumps({"status": "error", "message": "获取成员列表为空或权限不足。"}, ensure_ascii=False)
 
+            # 超大群先按角色排序（群主、管理员在前），保证截断后保留最重要的成员
+            if len(raw_members) > _MEMBERS_LIMIT:
+                raw_members = sorted(raw_members, key=lambda m: _ROLE_ORDER.get(m.get("role"), 2))
+
             # 数据清洗与格式化
             formatted_members = []
+            truncated = False
             
             for m in raw_members:
                 user_id = str(m.get("user_id", ""))
@@ -84,15 +161,23 @@ class LLMAtToolPlugin(Star):
                 if keyword and keyword not in search_content:
                     continue
 
-                # 角色中文映射
-                role_map = {"owner": "群主", "admin": "管理员", "member": "成员"}
-                role_cn = role_map.get(role, "成员")
+                # 已达上限且仍有匹配成员：截断，控制序列化与 LLM token 开销
+                if len(formatted_members) >= _MEMBERS_LIMIT:
+                    truncated = True
+                    break
+
+                # 群名片与昵称合并为单个可读字符串，减少每成员的字段数与序列化体积
+                if not card or card == nickname:
+                    name = nickname
+                elif not nickname:
+                    name = card
+                else:
+                    name = f"{card}|{nickname}"
 
                 formatted_members.append({
                     "user_id": user_id,
-                    "nickname": nickname,
-                    "group_card": card if card else "无",
-                    "role": role_cn
+                    "name": name,
+                    "role": _ROLE_MAP.get(role, "成员")
                 })
 
             result_members = formatted_members
@@ -103,10 +188,14 @@ class LLMAtToolPlugin(Star):
                 "count": len(result_members),
                 "members": result_members
             }
+            if truncated:
+                output_data["truncated"] = True
+                output_data["hint"] = "成员过多，仅返回前 %d 人（群主、管理员优先），可用 keyword 缩小范围。" % _MEMBERS_LIMIT
 
-            logger.debug(f"群成员查询成功，耗时 {time.time() - start_time:.2f}s，返回 {len(result_members)} 人")
+            # 惰性格式化：DEBUG 未开启时不做字符串拼接
+            logger.debug("群成员查询成功，耗时 %.2fs，返回 %d 人", time.monotonic() - start_time, len(result_members))
             # 返回 JSON 格式
-            return json.dumps(output_data, ensure_ascii=False, indent=2)
+            return _dumps(output_data)
 
         except Exception as e:
             logger.error(f"查询群成员失败: {e}")
@@ -118,50 +207,59 @@ class LLMAtToolPlugin(Star):
         """
         拦截消息：
         1. 将 [at:123456] 转换为真实 At 组件。
-        2. (修改后) 不再清除格式错误的 [at:xxx] 标签。
+        2. 清除格式错误的 [at:xxx] 标签（与转换在同一趟正则扫描中完成）。
         """
         result = event.get_result()
         if not result or not result.chain:
             return
 
-        has_tag = False
-        for comp in result.chain:
-            if isinstance(comp, Plain) and "[at:" in comp.text:
-                has_tag = True
-                break
-        
-        if not has_tag:
+        # 快速预检：链中没有疑似标签时直接返回，不做任何重建
+        if not any(type(comp) is Plain and _AT_MARK in comp.text for comp in result.chain):
             return
 
         new_chain: List[BaseMessageComponent] = []
 
         for comp in result.chain:
-            if isinstance(comp, Plain):
+            if type(comp) is Plain:
                 text = comp.text
-                
+                # 无标签的 Plain 原样保留（不新建对象），跳过整个扫描
+                first_mark = text.find(_AT_MARK)
+                if first_mark < 0:
+                    new_chain.append(comp)
+                    continue
                 last_idx = 0
-                # 查找所有合法的 [at:数字]
-                for match in self.valid_at_pattern.finditer(text):
-                    start, end = match.span()
-
-                    # 处理标签前的文本
+                # 相邻的纯文本（@后的分隔符 + 标签间文本）先累积，
+                # 合并为单个 Plain，减少下游需要遍历的组件数
+                pending: List[str] = []
+                # 预检已定位首个标记，扫描从该处续接，标记前的文本只走一次
+                for start, end, target_id in _scan_at_tags(text, first_mark):
                     if start > last_idx:
-                        # 只添加标签前的文本，不做任何过滤
-                        new_chain.append(Plain(text[last_idx:start]))
-                    
-                    target_id = match.group(1)
-                    
-                    # 插入真实组件
-                    new_chain.append(At(qq=target_id))
-                    # 可以考虑在@后加一个空格，避免粘连
-                    new_chain.append(Plain(" "))
-                    new_chain.append(Plain("\u200b"))
-
+                        pending.append(text[last_idx:start])
                     last_idx = end
-
-                # 处理最后一个标签后的剩余文本
+                    # id 为 None 说明是格式错误的标签，直接丢弃
+                    if target_id is None:
+                        continue
+                    at_comp = self._at_cache.get(target_id)
+                    if at_comp is None:
+                        at_comp = At(qq=target_id)
+                        if len(self._at_cache) < _AT_CACHE_MAX:
+                            self._at_cache[target_id] = at_comp
+                    # 插入真实组件，带缓冲文本时用 extend 一次性批量追加
+                    if pending:
+                        buffered = "".join(pending)
+                        pending.clear()
+                        new_chain.extend((
+                            self._at_sep if buffered == _AT_SEP else Plain(buffered),
+                            at_comp,
+                        ))
+                    else:
+                        new_chain.append(at_comp)
+                    pending.append(_AT_SEP)
                 if last_idx < len(text):
-                    new_chain.append(Plain(text[last_idx:]))
+                    pending.append(text[last_idx:])
+                if pending:
+                    buffered = "".join(pending)
+                    new_chain.append(self._at_sep if buffered == _AT_SEP else Plain(buffered))
             else:
                 new_chain.append(comp)
         